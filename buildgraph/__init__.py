@@ -1,4 +1,5 @@
 from .base_step import BaseStep, CircularDependencyException  # noqa
 from .binding import ParameterLengthException, TypeMismatchException  # noqa
+from .cache import setCacheDir  # noqa
 from .colours import setColor, setColour  # noqa
-from .graph import buildgraph  # noqa
+from .graph import GraphConstructionError, buildgraph  # noqa
@@ -1,21 +1,134 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import heapq
 import inspect
+import itertools
+import os
+import pickle
+import time
 import traceback
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 
+from . import cache
 from .binding import Binding
 from .colours import colGetter as col
 from .context import addToContext, getContext
 from .exception import CircularDependencyException, StepFailedException, pass_exceptions
 from .graph import Graph
 from .tabulated_writer import tabbuffer
-from .timer import DurationTimer
+from .timer import format_time
+
+# Incremented by `after` so that cached graph traversals are recomputed
+_dependency_version = 0
+
+# Steps are numbered in the order they're defined so independent steps run in that order
+_order_counter = itertools.count()
+
+
+@functools.lru_cache(maxsize=None)
+def _functionSource(function):
+    """Returns the source of `function`, or its bytecode if the source isn't available"""
+    try:
+        return inspect.getsource(function).encode()
+    except (OSError, TypeError):
+        return function.__code__.co_code
+
+
+def _hashValue(digest, value):
+    """Feeds a value bound to a step into `digest`. Steps and graphs contribute their fingerprint
+    and paths to existing files contribute the file contents.
+    """
+    if isinstance(value, (BaseStep, Graph)):
+        digest.update(value.fingerprint().encode())
+    elif isinstance(value, os.PathLike) and os.path.isfile(value):
+        cache.hashFile(digest, value)
+    else:
+        digest.update(repr(value).encode())
+    digest.update(b"\0")
+
+
+def _runCoroutine(coroutine):
+    """Runs a coroutine to completion from synchronous code"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    # This thread is already running an event loop, so use another thread with its own loop.
+    # The coroutine runs in a copy of this context so its output is tabulated like the caller's.
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(context.run, asyncio.run, coroutine).result()
+
+
+def _findDuplicates(order):
+    """Maps each pure step in `order` to the first pure step with the same fingerprint that
+    depends on the same impure steps, if it isn't that step itself
+    """
+    # Fingerprints only cover how the steps upstream are defined. Separate impure steps with the
+    # same definition can produce different results, so they're told apart by identity.
+    impure_deps = {}
+    first = {}
+    duplicates = {}
+    for step in order:
+        upstream = set()
+        for dep in _dependencies(step):
+            if dep.pure:
+                upstream.update(impure_deps[dep])
+            else:
+                upstream.add(dep)
+        impure_deps[step] = frozenset(upstream)
+
+        if step.pure:
+            original = first.setdefault((step.fingerprint(), impure_deps[step]), step)
+            if original is not step:
+                duplicates[step] = original
+    return duplicates
+
+
+def _dependencies(step):
+    """Returns the steps that `step` depends on. Graphs are resolved to their root step."""
+    deps = []
+    for dep in step.after_deps + step.binding.bind_deps:
+        deps.append(Graph.resolveGraphToRoot(dep))
+    return deps
 
 
 class BaseStep:
     """Base class for a build step.
 
     Subclasses should implement an `execute` method.
+
+    Subclasses can set `cacheable = True` to have their results cached on disk and reused
+    when the step's fingerprint and the results of the steps upstream that aren't cacheable
+    or pure match a previous run. Environment variables that affect the result should be
+    listed in `cache_env`.
+
+    Subclasses can set `pure = True` if their result only depends on their fingerprint.
+    Identical pure steps in a graph are then only executed once per run.
     """
 
+    cacheable = False
+    cache_env = ()
+    pure = False
+
+    __slots__ = (
+        "config",
+        "indent_log",
+        "wasrun",
+        "result",
+        "after_deps",
+        "_alias",
+        "_order_index",
+        "_full_exec_cache",
+        "_order_cache",
+        "_fingerprint_cache",
+        "binding",
+    )
+
     def __init__(self, *args, indent_log=False, **kwargs):
         self.config = None
 
@@ -28,13 +141,36 @@ class BaseStep:
 
         self._alias = None
 
+        self._order_index = next(_order_counter)
+
+        self._full_exec_cache = None
+        self._order_cache = None
+        self._fingerprint_cache = None
+
         addToContext(self)
 
         context = getContext()
         if context is not None:
             self.configure(context.config)
 
-        self.binding = Binding(*args, **kwargs).bind(self.execute)
+        self.binding = Binding(*args, **kwargs).bind(
+            self.execute, self._execute_parameters()
+        )
+
+    def _execute_signature(self):
+        """Returns the signature of the bound `execute` method. This is only computed once per class."""
+        cls = type(self)
+        if "_EXECUTE_SIG" not in cls.__dict__:
+            # The bound method handles regular, static and class methods alike
+            signature = inspect.signature(self.execute)
+            cls._EXECUTE_SIG = signature
+            cls._EXECUTE_PARAMS = tuple(signature.parameters.values())
+        return cls._EXECUTE_SIG
+
+    def _execute_parameters(self):
+        """Returns a tuple of the parameters of the bound `execute` method"""
+        self._execute_signature()
+        return type(self)._EXECUTE_PARAMS
 
     def configure(self, config):
         pass
@@ -63,51 +199,126 @@ class BaseStep:
             print(f"{i+1:^{max_indent}} {step}")
         print()
 
-    def getExecutionOrder(self, order_list=None, downstream=None):
+    def getExecutionOrder(self):
         """Gets the execution order of this step's dependencies.
         This function will throw an exception if a loop is detected in the dependencies.
 
-        Args:
-            order_list ([list], optional): List containing the dependencies found so far in order
-            downstream ([type], optional): Downstream steps.
-
         Raises:
-            Exception: Raised when a loop is detected
+            CircularDependencyException: Raised when a loop is detected
 
         Returns:
-            [type]: [description]
+            list: The steps in the order they will be executed, ending with this step
         """
-        if order_list is None:
-            order_list = []
-        if downstream is None:
-            downstream = set()
-
-        if self in order_list:
-            return
+        return list(self._getCachedOrder()[1])
 
-        if self in downstream:
+    def getExecutionSet(self):
+        """Gets the steps in the execution order as a frozenset for fast membership checks.
+        This function will throw an exception if a loop is detected in the dependencies.
+        """
+        return self._getCachedOrder()[2]
+
+    def _getCachedOrder(self):
+        """Returns (version, order tuple, order frozenset), recomputed if the graph changed"""
+        version = _dependency_version
+        if self._order_cache is None or self._order_cache[0] != version:
+            order = self._computeExecutionOrder()
+            self._order_cache = (version, tuple(order), frozenset(order))
+        return self._order_cache
+
+    def _computeExecutionOrder(self):
+        # Find every step this one depends on, then sort them topologically with Kahn's
+        # algorithm. Of the steps that are ready, the one defined first goes next.
+        remaining = {}
+        dependents = {}
+        stack = [self]
+        while stack:
+            step = stack.pop()
+            if step in remaining:
+                continue
+            deps = set(_dependencies(step))
+            remaining[step] = len(deps)
+            for dep in deps:
+                dependents.setdefault(dep, []).append(step)
+                stack.append(dep)
+
+        ready = [
+            (step._order_index, step) for step, count in remaining.items() if not count
+        ]
+        heapq.heapify(ready)
+        order_list = []
+        while ready:
+            _, step = heapq.heappop(ready)
+            order_list.append(step)
+            for dependent in dependents.get(step, ()):
+                remaining[dependent] -= 1
+                if not remaining[dependent]:
+                    heapq.heappush(ready, (dependent._order_index, dependent))
+
+        # Steps in a loop never become ready, and neither do the steps downstream of one.
+        # Every stuck step has a stuck dependency, so following them must end up in the loop.
+        if len(order_list) != len(remaining):
+            step = next(step for step, count in remaining.items() if count)
+            seen = set()
+            while step not in seen:
+                seen.add(step)
+                step = next(dep for dep in _dependencies(step) if remaining[dep])
             raise CircularDependencyException(
-                f"Circular dependency detected involving {self}"
+                f"Circular dependency detected involving {step}"
             )
-        downstream.add(self)
-
-        for dep in self.after_deps:
-            dep.getExecutionOrder(order_list, downstream)
-
-        for dep in self.binding.bind_deps:
-            dep.getExecutionOrder(order_list, downstream)
-
-        order_list.append(self)
 
         return order_list
 
     def getFullExecution(self):
-        steps = {self}
-        for step in self.after_deps:
-            steps.update(step.getFullExecution())
-        for step in self.binding.bind_deps:
-            steps.update(step.getFullExecution())
-        return steps
+        """Gets a set of all steps and graphs that this step depends on, including itself"""
+        version = _dependency_version
+        if self._full_exec_cache is None or self._full_exec_cache[0] != version:
+            steps = set()
+            stack = [self]
+            while stack:
+                step = stack.pop()
+                if step in steps:
+                    continue
+                steps.add(step)
+                if isinstance(step, Graph):
+                    stack.append(step.root)
+                else:
+                    stack.extend(step.after_deps)
+                    stack.extend(step.binding.bind_deps)
+            self._full_exec_cache = (version, frozenset(steps))
+        return self._full_exec_cache[1]
+
+    def fingerprint(self):
+        """Gets a hash of everything that determines this step's result: its class, the source of
+        `execute`, its arguments (including the fingerprints of steps passed as arguments), the
+        environment variables in `cache_env` and any attributes set on the step (e.g. by `configure`).
+        Steps added with `after` only affect the order steps run in, so they aren't included.
+        """
+        version = _dependency_version
+        if self._fingerprint_cache is None or self._fingerprint_cache[0] != version:
+            # Fill in the fingerprints upstream first, so hashing a step argument only reads its
+            # cached fingerprint instead of recursing through the whole graph
+            for step in self._getCachedOrder()[1]:
+                cached = step._fingerprint_cache
+                if cached is None or cached[0] != version:
+                    step._fingerprint_cache = (version, step._computeFingerprint())
+        return self._fingerprint_cache[1]
+
+    def _computeFingerprint(self):
+        """Hashes this step. The fingerprints of the steps upstream must already be cached."""
+        cls = type(self)
+        digest = hashlib.sha256()
+        digest.update(f"{cls.__module__}.{cls.__qualname__}\0".encode())
+        digest.update(_functionSource(cls.execute))
+        for value in self.binding.arg_values:
+            _hashValue(digest, value)
+        for name, value in self.binding.kwarg_values.items():
+            digest.update(f"{name}=".encode())
+            _hashValue(digest, value)
+        for name in self.cache_env:
+            _hashValue(digest, (name, os.environ.get(name)))
+        if hasattr(self, "__dict__"):
+            _hashValue(digest, sorted(vars(self).items(), key=lambda item: item[0]))
+        return digest.hexdigest()
 
     def getResult(self):
         if self.wasrun is False:
@@ -115,9 +326,45 @@ class BaseStep:
         return self.result
 
     def getResultType(self):
-        return inspect.signature(self.execute).return_annotation
+        return self._execute_signature().return_annotation
+
+    def callExecute(self, use_cache=True):
+        prepared = self._prepareExecute(use_cache)
+        if prepared is None:
+            return
+        args, kwargs, cache_key = prepared
+
+        start = time.perf_counter()
+        try:
+            with tabbuffer(self.indent_log):
+                result = self.execute(*args, **kwargs)
+                if inspect.iscoroutine(result):
+                    result = _runCoroutine(result)
+        except Exception as e:
+            self._failExecute(e, args)
+        self._finishExecute(result, time.perf_counter() - start, cache_key)
+
+    async def _callExecuteAsync(self, use_cache):
+        """Executes a step with an async `execute` method on the running event loop"""
+        prepared = self._prepareExecute(use_cache)
+        if prepared is None:
+            return
+        args, kwargs, cache_key = prepared
+
+        start = time.perf_counter()
+        try:
+            result = await self.execute(*args, **kwargs)
+        except Exception as e:
+            self._failExecute(e, args)
+        self._finishExecute(result, time.perf_counter() - start, cache_key)
 
-    def callExecute(self):
+    def _prepareExecute(self, use_cache):
+        """Runs the step's dependencies and evaluates its arguments.
+
+        Returns:
+            Tuple(list, dict, str): The args, kwargs and cache key (if the result should be
+                cached) to execute with, or None if the result was loaded from the cache
+        """
         # Run after deps first
         for dep in self.after_deps:
             dep.getResult()
@@ -128,37 +375,174 @@ class BaseStep:
         # Get required args
         args, kwargs = self.binding.evaluateArgs()
 
+        cache_key = None
+        if use_cache and self.cacheable:
+            cache_key = self._cacheKey()
+        if cache_key is not None:
+            found, result = cache.CACHE.load(cache_key)
+            if found:
+                self.result = result
+                self.wasrun = True
+                print(f"{col.green}Cached{col.clear} {self}: {self._resultText()}\n")
+                return None
+
         print(f"{col.orange}Executing step {self}{col.clear}")
-        with DurationTimer() as timer:
+        return args, kwargs, cache_key
+
+    def _cacheKey(self):
+        """Returns the key this step's result is cached under, or None if it can't be cached.
+
+        The fingerprint only covers how the steps upstream are defined. Steps upstream that
+        aren't cacheable or pure can produce a different result each time they're run, so their
+        results are part of the key. They have already run when this is called.
+        """
+        digest = hashlib.sha256(self.fingerprint().encode())
+        for dep in self._getCachedOrder()[1][:-1]:
+            if dep.cacheable or dep.pure:
+                continue
             try:
-                with tabbuffer(self.indent_log):
-                    self.result = self.execute(*args, **kwargs)
-                    self.wasrun = True
-            except Exception as e:
-                with tabbuffer():
-                    print(traceback.format_exc())
-                print(f"{col.red}Failed{col.clear}")
-                raise StepFailedException(self, e, args) from None
-
-        result_text = (
-            self.result
-            if self.result is not None
-            else f"{col.grey}{self.result}{col.clear}"
+                digest.update(pickle.dumps(dep.result))
+            except (pickle.PicklingError, TypeError, AttributeError):
+                return None
+        return digest.hexdigest()
+
+    def _failExecute(self, exception, args):
+        """Prints the exception being handled and raises it as a StepFailedException"""
+        with tabbuffer():
+            print(traceback.format_exc())
+        print(f"{col.red}Failed{col.clear}")
+        raise StepFailedException(self, exception, args) from None
+
+    def _finishExecute(self, result, duration, cache_key):
+        self.result = result
+        self.wasrun = True
+
+        if cache_key is not None:
+            cache.CACHE.store(cache_key, self.result)
+
+        duration_text = format_time(duration)
+        print(
+            f"{col.green}Success{col.clear} [{duration_text}]: {self._resultText()}\n"
         )
-        print(f"{col.green}Success{col.clear} [{timer.format()}]: {result_text}")
-        print()
+
+    def _resultText(self):
+        if self.result is None:
+            return f"{col.grey}{self.result}{col.clear}"
+        return self.result
 
     @pass_exceptions
-    def run(self):
+    def run(self, parallel=False, max_workers=None, use_cache=True):
+        """Runs this step and all of its dependencies and returns the result.
+
+        Args:
+            parallel (bool, optional): If true, steps that don't depend on each other are run
+                concurrently on worker threads. Their output may be interleaved.
+            max_workers (int, optional): The maximum number of steps to run at once in parallel mode
+            use_cache (bool, optional): If false, cacheable steps are executed even if they have a
+                cached result. Their new results are still saved to the cache.
+        """
         # Get the order so that any loops will throw
         order = self.getExecutionOrder()
-        print(f"Running all {len(order)} build steps")
-        print()
-        with DurationTimer() as timer:
-            result = self.getResult()
-        print(f"Build finished in {timer.format()}")
+        print(f"Running all {len(order)} build steps\n")
+        start = time.perf_counter()
+        if parallel:
+            self._runParallel(order, max_workers, use_cache)
+        else:
+            duplicates = _findDuplicates(order)
+            for step in order:
+                if step.wasrun:
+                    continue
+                if step in duplicates:
+                    step._reuseResult(duplicates[step])
+                else:
+                    step.callExecute(use_cache)
+        result = self.getResult()
+        print(f"Build finished in {format_time(time.perf_counter() - start)}")
         return result
 
+    @staticmethod
+    def _runParallel(order, max_workers, use_cache):
+        """Runs the steps in `order` concurrently, starting each one as soon as all of
+        its dependencies have finished.
+        """
+        _runCoroutine(BaseStep._runAsync(order, max_workers, use_cache))
+
+    @staticmethod
+    async def _runAsync(order, max_workers, use_cache):
+        semaphore = asyncio.Semaphore(max_workers) if max_workers else None
+
+        duplicates = _findDuplicates(order)
+        tasks = {}
+        for step in order:
+            if step in duplicates:
+                original = duplicates[step]
+                tasks[step] = asyncio.ensure_future(
+                    step._reuseAfter(tasks[original], original)
+                )
+                continue
+            deps = [tasks[dep] for dep in set(_dependencies(step))]
+            tasks[step] = asyncio.ensure_future(
+                step._runAfter(deps, semaphore, use_cache)
+            )
+
+        done, pending = await asyncio.wait(
+            tasks.values(), return_when=asyncio.FIRST_EXCEPTION
+        )
+        # Steps that have started will finish but no more will be started
+        for task in pending:
+            task.cancel()
+
+        # Retrieve every failure so none are reported as unhandled, then raise the earliest
+        failures = [task.exception() for task in tasks.values() if task in done]
+        failures = [failure for failure in failures if failure is not None]
+        if failures:
+            raise failures[0]
+
+    async def _runAfter(self, deps, semaphore, use_cache):
+        """Waits for the `deps` tasks to finish and then runs this step"""
+        if deps:
+            await asyncio.gather(*deps)
+        if self.wasrun:
+            return
+
+        if semaphore is None:
+            await self._executeAsync(use_cache)
+        else:
+            async with semaphore:
+                await self._executeAsync(use_cache)
+
+    async def _reuseAfter(self, task, original):
+        """Waits for the task running `original` and then takes its result"""
+        await task
+        if self.wasrun:
+            return
+        self._reuseResult(original)
+
+    def _reuseResult(self, original):
+        """Takes the result of an identical pure step instead of executing this one"""
+        self.result = original.result
+        self.wasrun = True
+        print(f"{col.green}Reused{col.clear} result of {original} for {self}\n")
+
+    async def _executeAsync(self, use_cache):
+        # Async steps run on the event loop. Indented steps tabulate their output for the whole
+        # of callExecute, so they run it on a worker thread like synchronous steps.
+        if inspect.iscoroutinefunction(self.execute) and not self.indent_log:
+            await self._callExecuteAsync(use_cache)
+        else:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.callExecute, use_cache)
+
+    def invalidate(self):
+        """Clears the cached execution order and full execution of this step and every step
+        downstream of it. This is called by `after`. Subclasses that change their dependencies
+        in other ways should call it too.
+        """
+        # Caches are tagged with the version they were computed at, so bumping it
+        # invalidates them all without having to find the steps downstream of this one
+        global _dependency_version
+        _dependency_version += 1
+
     def after(self, *deps, front=False):
         """Add steps that this step will run after.
 
@@ -168,11 +552,18 @@ class BaseStep:
         method but still need to be synchronised.
 
         Args:
-            front (bool, optional): If true, new dependencies will be inserted at the front.
-                E.g. b.after(a).after(c, front=True) will run c -> a -> b
-                     b.after(a).after(c) will run a -> c -> b
+            front (bool, optional): Deprecated. Dependencies that don't depend on each other run
+                in the order they were defined, so inserting new dependencies at the front of this
+                step's dependency list no longer changes the execution order.
         """
+        self.invalidate()
+
         if front:
+            warnings.warn(
+                "after(front=True) no longer changes the execution order and will be removed",
+                DeprecationWarning,
+                stacklevel=2,
+            )
             self.after_deps = list(deps) + self.after_deps
         else:
             self.after_deps.extend(deps)
@@ -1,7 +1,17 @@
 import inspect
+from collections import deque
+from functools import partial
+from operator import attrgetter
 
 from . import base_step, graph
 
+_get_result = attrgetter("result")
+
+
+def _const_getter(value):
+    """Returns a function that returns `value`"""
+    return lambda: value
+
 
 class TypeMismatchException(Exception):
     pass
@@ -12,32 +22,55 @@ class ParameterLengthException(Exception):
 
 
 class Binding:
+    __slots__ = (
+        "args",
+        "kwargs",
+        "bind_deps",
+        "arg_getters",
+        "kwarg_getters",
+        "arg_values",
+        "kwarg_values",
+        "_evaluator",
+    )
+
     def __init__(self, *args, **kwargs):
-        self.args = list(args)  # Convert to list so it's mutable
+        self.args = deque(args)  # Args are consumed from the front as they're bound
         self.kwargs = kwargs
 
         self.bind_deps = []
         self.arg_getters = []
         self.kwarg_getters = {}
 
+        # The bound arguments as they were passed in, used for fingerprinting
+        self.arg_values = []
+        self.kwarg_values = {}
+
     def resolve_arg(self, param, arg):
         """Resolves the argument to a step's execute function and returns a
         function that will return the true value of the argument.
 
         For arguments that are themselves steps, the function will return the
-        resul of the step.
+        resul of the step. Steps must have been run before the function is called.
 
         For all other arguments, the function will return the value of the argument.
         """
 
-        getter = lambda arg=arg: arg
-        arg_type = type(arg)
-        if issubclass(type(arg), base_step.BaseStep) or type(arg) == graph.Graph:
+        if isinstance(arg, (base_step.BaseStep, graph.Graph)):
             self.bind_deps.append(arg)
-            getter = lambda arg=arg: arg.getResult()
+            if isinstance(arg, graph.Graph):
+                getter = arg.getResult
+            else:
+                # Read the stored result without going through getResult
+                getter = partial(_get_result, arg)
             arg_type = arg.getResultType()
-
-        if param.annotation != inspect._empty and arg_type != inspect._empty:
+        else:
+            getter = _const_getter(arg)
+            arg_type = type(arg)
+
+        if (
+            param.annotation is not inspect.Parameter.empty
+            and arg_type is not inspect.Parameter.empty
+        ):
             if not issubclass(arg_type, param.annotation):
                 raise TypeMismatchException(
                     f"Setup failed. Parameter {param.name} of {self} expects {param.annotation} but got {arg_type}"
@@ -53,9 +86,10 @@ class Binding:
         """
         if not self.args:
             return False
-        arg = self.args.pop(0)
+        arg = self.args.popleft()
         getter = self.resolve_arg(param, arg)
         self.arg_getters.append(getter)
+        self.arg_values.append(arg)
         return True
 
     def bind_kwarg(self, param):
@@ -66,22 +100,21 @@ class Binding:
         """
         if param.name not in self.kwargs:
             return False
-        kwarg = self.kwargs[param.name]
-        del self.kwargs[param.name]
+        kwarg = self.kwargs.pop(param.name)
         getter = self.resolve_arg(param, kwarg)
         self.kwarg_getters[param.name] = getter
+        self.kwarg_values[param.name] = kwarg
         return True
 
     def bind_all_kwargs(self, param):
         """Fulfill the variadic param with all keyword arguments.
         This is used for variadic keyword arguments
         """
-        while self.kwargs:
-            first = next(iter(self.kwargs.keys()))
-            kwarg = self.kwargs[first]
-            del self.kwargs[first]
+        for name in list(self.kwargs):
+            kwarg = self.kwargs.pop(name)
             getter = self.resolve_arg(param, kwarg)
-            self.kwarg_getters[first] = getter
+            self.kwarg_getters[name] = getter
+            self.kwarg_values[name] = kwarg
 
     def consume_arg(self, param: inspect.Parameter, use_arg: bool, use_kwarg: bool):
         """Consumes an argument from the args list or kwargs dict to
@@ -95,7 +128,7 @@ class Binding:
             use_arg: Whether to use positional args for binding
             use_kwarg: Whether to use keyword args for binding
         """
-        optional = param.default != inspect._empty
+        optional = param.default is not inspect.Parameter.empty
 
         bound = False
         if use_arg:  # Try binding with a positional arg
@@ -111,22 +144,44 @@ class Binding:
             )
 
     def evaluateArgs(self):
-        return (
-            [getter() for getter in self.arg_getters],
-            {k: getter() for k, getter in self.kwarg_getters.items()},
-        )
+        return self._evaluator()
 
-    def bind(self, function):
+    def _compileEvaluator(self):
+        """Builds the function used by evaluateArgs. If none of the arguments come from
+        steps their values can't change, so they're evaluated once here instead.
+        """
+        arg_getters = tuple(self.arg_getters)
+        kwarg_getters = tuple(self.kwarg_getters.items())
+
+        if not self.bind_deps:
+            args = [getter() for getter in arg_getters]
+            kwargs = {k: getter() for k, getter in kwarg_getters}
+            return lambda: (args, kwargs)
+
+        def evaluate():
+            return (
+                [getter() for getter in arg_getters],
+                {k: getter() for k, getter in kwarg_getters},
+            )
+
+        return evaluate
+
+    def bind(self, function, parameters=None):
         """Bind the arguments to the provided signature. If an argument is an instance of BaseStep,
         that argument will provide its result to the as the bound value and evaluation of the step
         will be deferred until it is needed.
 
         Returns structures containing functions that will return the value of each argument.
+
+        Args:
+            function: The function to bind arguments to
+            parameters (tuple, optional): The parameters of `function` if they're already known
         """
 
-        signature = inspect.signature(function)
+        if parameters is None:
+            parameters = tuple(inspect.signature(function).parameters.values())
 
-        for param in signature.parameters.values():
+        for param in parameters:
             # There are 5 kinds of parameter that have different cases:
             if param.kind == param.POSITIONAL_ONLY:
                 # Consume one arg
@@ -155,4 +210,5 @@ class Binding:
                 f"{self} received unexpected keyword arguments: {[k for k in self.kwargs.keys()]}"
             )
 
+        self._evaluator = self._compileEvaluator()
         return self
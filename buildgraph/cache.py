@@ -0,0 +1,79 @@
+import os
+import pickle
+import tempfile
+
+
+def defaultCacheDir():
+    """Returns the default directory for cached results, ~/.cache/buildgraph unless
+    XDG_CACHE_HOME is set
+    """
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(root, "buildgraph")
+
+
+def hashFile(digest, path, chunk_size=65536):
+    """Feeds the contents of the file at `path` into `digest` without reading it all into memory"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+
+
+class GraphCache:
+    """Stores the results of cacheable steps on disk, keyed by the step's fingerprint"""
+
+    def __init__(self, directory=None):
+        self.directory = directory if directory is not None else defaultCacheDir()
+
+    def _path(self, fingerprint):
+        return os.path.join(self.directory, fingerprint + ".pkl")
+
+    def load(self, fingerprint):
+        """Loads a cached result.
+
+        Returns:
+            Tuple(bool, object): Whether the result was found and the result itself
+        """
+        try:
+            with open(self._path(fingerprint), "rb") as f:
+                return True, pickle.load(f)
+        except Exception:
+            # Missing or corrupt entries, and entries for classes that were moved or renamed
+            # since they were stored, are cache misses
+            return False, None
+
+    def store(self, fingerprint, result):
+        """Saves a result to the cache. Results that can't be pickled or written aren't cached."""
+        try:
+            data = pickle.dumps(result)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+
+        # Write to a uniquely named temporary file first so a partially written result is never
+        # loaded, even when identical steps store the same result from several threads at once
+        temp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                dir=self.directory, suffix=".tmp", delete=False
+            ) as f:
+                temp_path = f.name
+                f.write(data)
+            os.replace(temp_path, self._path(fingerprint))
+        except OSError:
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+
+CACHE = GraphCache()
+
+
+def setCacheDir(directory):
+    CACHE.directory = directory
@@ -16,6 +16,7 @@ def setColor(state):
 def setColour(state):
     global COL_ON
     COL_ON = state
+    colGetter.update()
 
 
 def getColour(name):
@@ -26,8 +27,16 @@ def getColour(name):
 
 
 class ColGetter:
-    def __getattr__(self, name):
-        return getColour(name)
+    """Exposes each colour as a lowercase attribute, e.g. `colGetter.green`.
+    The attributes are set up front so accessing them is a plain attribute lookup.
+    """
+
+    def __init__(self):
+        self.update()
+
+    def update(self):
+        for name in COLOURS:
+            setattr(self, name.lower(), getColour(name))
 
 
 colGetter = ColGetter()
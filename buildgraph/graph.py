@@ -1,4 +1,7 @@
 import functools
+import hashlib
+import os
+from collections import OrderedDict
 from collections.abc import Mapping, Sequence
 
 from . import base_step
@@ -10,6 +13,39 @@ class UndefinedConfig:
     pass
 
 
+class GraphConstructionError(Exception):
+    pass
+
+
+# Set BUILDGRAPH_VALIDATE=0 or run with `python -O` to skip checking graphs as they're built
+VALIDATE_GRAPH = os.environ.get("BUILDGRAPH_VALIDATE", "1") != "0"
+
+
+# How many built graphs a memoized graph function keeps
+MEMOIZE_SIZE = 64
+
+
+# Shapes a graph's return value can take, worked out once when the graph is built
+_NONE, _SINGLE, _MAPPING, _SEQUENCE, _UNUSABLE = range(5)
+
+
+def _resultKind(result):
+    if result is None:
+        return _NONE
+    if isinstance(result, (Graph, base_step.BaseStep)):
+        return _SINGLE
+    # Check the common concrete types before falling back to the slower ABC checks
+    if isinstance(result, dict):
+        return _MAPPING
+    if isinstance(result, (list, tuple)):
+        return _SEQUENCE
+    if isinstance(result, Mapping):
+        return _MAPPING
+    if isinstance(result, Sequence):
+        return _SEQUENCE
+    return _UNUSABLE
+
+
 class Graph:
     """Graphs provide a reference to a root step and are returned by the buildgraph decorator.
 
@@ -21,43 +57,54 @@ class Graph:
          \ But return from B
     """
 
+    __slots__ = ("name", "root", "result", "_result_kind", "_full_exec_cache")
+
     def has_single_result(self):
         """Returns true if the graph has a single return value. If it returns a tuple of steps or other
         type this returns false.
         """
-        if type(self.result) == Graph or isinstance(self.result, base_step.BaseStep):
-            return True
-        return False
+        return self._result_kind == _SINGLE
 
     def map_results(self, func):
-        if isinstance(self.result, Mapping):
+        if self._result_kind == _MAPPING:
             return {r: func(self.result[r]) for r in self.result}
 
-        if isinstance(self.result, Sequence):
+        if self._result_kind == _SEQUENCE:
             return [func(r) for r in self.result]
 
         raise UnusableReturnType(
             f"Graph {self.name} has unusable return type {type(self.result)}"
         )
 
-    @staticmethod
-    def assert_true(value):
-        assert value
-
     def __init__(self, name, root, result):
         self.name = name
         self.root = root
         self.result = Graph.resolveResultToStep(result)
+        self._result_kind = _resultKind(self.result)
 
-        if self.result is not None:
-            execution_order = self.root.getExecutionOrder()
-            if self.has_single_result():
-                assert self.result in execution_order
-            else:
-                self.map_results(lambda r: self.assert_true(r in execution_order))
+        self._full_exec_cache = None
+
+        if __debug__ and VALIDATE_GRAPH and self.result is not None:
+            self._validateResults()
 
         addToContext(self)
 
+    def _validateResults(self):
+        """Raises GraphConstructionError if the graph returns a step that its root doesn't run"""
+        execution_set = self.root.getExecutionSet()
+        if self.has_single_result():
+            results = [self.result]
+        else:
+            results = self.map_results(lambda r: r)
+            if self._result_kind == _MAPPING:
+                results = results.values()
+
+        for result in results:
+            if result not in execution_set:
+                raise GraphConstructionError(
+                    f"Graph {self.name} returns {result} which isn't run by the graph"
+                )
+
     def __iter__(self):
         return iter(self.result)
 
@@ -68,8 +115,8 @@ class Graph:
         return f"<Graph {self.name}>"
 
     @pass_exceptions
-    def run(self):
-        self.root.run()
+    def run(self, parallel=False, max_workers=None, use_cache=True):
+        self.root.run(parallel=parallel, max_workers=max_workers, use_cache=use_cache)
         return self.getResult()
 
     def getResult(self):
@@ -82,6 +129,17 @@ class Graph:
             return self.result.getResult()
         return self.map_results(lambda r: r.getResult())
 
+    def fingerprint(self):
+        """Gets a hash of the steps this graph runs and the steps it returns results from"""
+        digest = hashlib.sha256(self.root.fingerprint().encode())
+        if self.result is not None:
+            if self.has_single_result():
+                results = self.result.fingerprint()
+            else:
+                results = self.map_results(lambda r: r.fingerprint())
+            digest.update(repr(results).encode())
+        return digest.hexdigest()
+
     def getResultType(self):
         if self.result is None:
             return None
@@ -89,26 +147,86 @@ class Graph:
 
     @staticmethod
     def resolveResultToStep(step):
-        if type(step) == Graph:
-            return Graph.resolveResultToStep(step.result)
+        while isinstance(step, Graph):
+            step = step.result
         return step
 
+    @staticmethod
+    def resolveGraphToRoot(step):
+        while isinstance(step, Graph):
+            step = step.root
+        return step
+
+    # These are forwarded to the root explicitly so they don't go through __getattr__
+
+    @property
+    def wasrun(self):
+        return self.root.wasrun
+
+    def getExecutionOrder(self):
+        return self.root.getExecutionOrder()
+
+    def getExecutionSet(self):
+        return self.root.getExecutionSet()
+
+    def printExecutionOrder(self):
+        self.root.printExecutionOrder()
+
+    def after(self, *deps, front=False):
+        """Makes the root of this graph run after `deps`. See `BaseStep.after`."""
+        self.root.after(*deps, front=front)
+        return self
+
     def getFullExecution(self):
         """Gets a set of all steps and graphs that this graph depends on"""
-        steps = {self}
-        steps.update(self.root.getFullExecution())
-        return steps
+        version = base_step._dependency_version
+        if self._full_exec_cache is None or self._full_exec_cache[0] != version:
+            steps = {self}
+            steps.update(self.root.getFullExecution())
+            self._full_exec_cache = (version, frozenset(steps))
+        return self._full_exec_cache[1]
 
     def __getattr__(self, attr):
         return getattr(self.root, attr)
 
 
-def buildgraph(outer_func=None):
-    """Builds a graph from a graph-defining function and returns the last step in that graph"""
+def buildgraph(outer_func=None, memoize=False):
+    """Builds a graph from a graph-defining function and returns the last step in that graph
+
+    Args:
+        memoize (bool, optional): If true, calling the function again with the same arguments and
+            config returns the graph that was already built instead of building a new one.
+            The steps in that graph only run once.
+    """
 
     def decorator(func):
+        built = OrderedDict()
+
         @functools.wraps(func)
         def wrapper(*args, config=UndefinedConfig, **kwargs):
+            # Graphs built inside another graph belong to its context, so they're always rebuilt
+            if not memoize or getContext() is not None:
+                return build(args, kwargs, config)
+
+            # Configs are usually dicts, so they're compared by identity
+            key = (args, tuple(sorted(kwargs.items())), id(config))
+            try:
+                entry = built.get(key)
+            except TypeError:  # Unhashable arguments
+                return build(args, kwargs, config)
+
+            if entry is not None and entry[0] is config:
+                built.move_to_end(key)
+                return entry[1]
+
+            graph = build(args, kwargs, config)
+            # Keep the config alive so its id can't be reused while it's a key
+            built[key] = (config, graph)
+            if len(built) > MEMOIZE_SIZE:
+                built.popitem(last=False)
+            return graph
+
+        def build(args, kwargs, config):
             if config == UndefinedConfig and getContext() is not None:
                 config = getContext().config
             with makeContext(config) as context:
@@ -122,13 +240,20 @@ def buildgraph(outer_func=None):
                         )
                     return ret
 
-                prev = context.steps[0]
-                for step in context.steps[1:]:
-                    step.after(prev)
-                    prev = step
-
-                # Pick the last defined final so that it's executed last
-                root = context.steps[-1]
+                # Finals are steps that nothing else in the graph depends on. The root runs
+                # after all of them so running the graph runs every step defined in it.
+                steps = [Graph.resolveGraphToRoot(step) for step in context.steps]
+                non_finals = set()
+                for step in steps:
+                    non_finals.update(base_step._dependencies(step))
+                finals = [step for step in steps if step not in non_finals]
+
+                # Pick the last defined final so that it's executed last. Without finals there's
+                # a loop, which is reported when the graph is run.
+                root = finals[-1] if finals else steps[-1]
+                others = [step for step in finals if step is not root]
+                if others:
+                    root.after(*others)
 
             return Graph(func.__name__, root, ret)
 
@@ -1,4 +1,3 @@
-import asyncio
 from dataclasses import dataclass
 
 from .base_step import BaseStep
@@ -15,8 +14,12 @@ class CommandStep(BaseStep):
         CommandStep.Result object containing the return code, stdout and stderr
     """
 
+    __slots__ = ()
+
     @dataclass
     class Result:
+        __slots__ = ("code", "stdout", "stderr")
+
         code: int
         stdout: bytes
         stderr: bytes
@@ -27,13 +30,11 @@ class CommandStep(BaseStep):
     class UnexpectedReturnCode(Exception):
         pass
 
-    def execute(self, command, *args, expected_code=0, suppress_log=False, **kwargs):
-        loop = asyncio.get_event_loop()
-
-        output = loop.run_until_complete(
-            execute_process_and_print(
-                command, *args, suppress_log=suppress_log, **kwargs
-            )
+    async def execute(
+        self, command, *args, expected_code=0, suppress_log=False, **kwargs
+    ):
+        output = await execute_process_and_print(
+            command, *args, suppress_log=suppress_log, **kwargs
         )
         results = CommandStep.Result(output[0], output[1], output[2])
 
@@ -1,10 +1,22 @@
 import sys
+import threading
 from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Guards installing and removing the routers on the shared stdout and stderr buffers
+_LOCK = threading.Lock()
+_ROUTERS = {}
 
 
 class TabulatedWriter:
     """Overrides a binary writer to insert 2 space before each line."""
 
+    __slots__ = ("parent", "writer_name", "blank", "writer")
+
+    _INDENT = b"  "
+    _NL = b"\n"
+    _NL_INDENT = _NL + _INDENT
+
     def __init__(self, parent, writer_name):
         self.parent = parent
         self.writer_name = writer_name
@@ -14,21 +26,25 @@ class TabulatedWriter:
         setattr(parent, writer_name, self.write)
 
     def write(self, data):
-        if self.blank:
-            self.blank = False
-            self.writer(b"  ")
+        if not data:
+            return
 
-        lines = data.split(b"\n")
-        if lines[-1] == b"":
-            lines.pop()
-            self.blank = True
+        # Build the whole output first so each write is passed on as a single call
+        trailing = data.endswith(self._NL)
+        body = data[:-1] if trailing else data
+        body = body.replace(self._NL, self._NL_INDENT)
+        if self.blank:
+            body = self._INDENT + body
+        if trailing:
+            body += self._NL
+        self.blank = trailing
 
-        self.writer(b"\n  ".join(lines) + b"\n")
+        self.writer(body)
 
     def shutdown(self):
         setattr(self.parent, self.writer_name, self.writer)
         if not self.blank:
-            self.writer(b"\n")
+            self.writer(self._NL)
 
     def __enter__(self):
         return self
@@ -37,6 +53,61 @@ class TabulatedWriter:
         self.shutdown()
 
 
+class _Router:
+    """Replaces the write method of a writer shared by all threads with one that passes each
+    write on to the writer set in the caller's context. Each thread (and each asyncio task) can
+    then tabulate its output independently, and only the writes to the shared writer are serialised.
+    """
+
+    __slots__ = ("parent", "original", "lock", "current", "users")
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.original = parent.write
+        self.lock = threading.Lock()
+        self.current = ContextVar("writer", default=self.writeShared)
+        self.users = 0
+        parent.write = self.write
+
+    # TabulatedWriter wraps the `writer` attribute, so it's backed by the context variable
+    @property
+    def writer(self):
+        return self.current.get()
+
+    @writer.setter
+    def writer(self, writer):
+        self.current.set(writer)
+
+    def write(self, data):
+        return self.current.get()(data)
+
+    def writeShared(self, data):
+        with self.lock:
+            return self.original(data)
+
+    def restore(self):
+        self.parent.write = self.original
+
+
+@contextmanager
+def _tabulate(parent):
+    """Tabulates writes to `parent` that are made from the current context"""
+    with _LOCK:
+        router = _ROUTERS.get(id(parent))
+        if router is None:
+            router = _ROUTERS[id(parent)] = _Router(parent)
+        router.users += 1
+    try:
+        with TabulatedWriter(router, "writer"):
+            yield
+    finally:
+        with _LOCK:
+            router.users -= 1
+            if not router.users:
+                router.restore()
+                del _ROUTERS[id(parent)]
+
+
 @contextmanager
 def tabbuffer(
     enable=True,
@@ -44,6 +115,6 @@ def tabbuffer(
     if not enable:
         yield
         return
-    with TabulatedWriter(sys.stderr.buffer, "write"):
-        with TabulatedWriter(sys.stdout.buffer, "write"):
+    with _tabulate(sys.stderr.buffer):
+        with _tabulate(sys.stdout.buffer):
             yield
@@ -1,49 +1,51 @@
+import bisect
 import time
 from contextlib import contextmanager
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(init=False)
 class DurationTimer:
-    start: float = None
-    end: float = None
-    seconds: float = None
+    # Dataclass fields with defaults can't be combined with __slots__ before Python 3.10
+    __slots__ = ("start", "end", "seconds")
+
+    start: int  # Nanoseconds from the performance counter
+    end: int
+    seconds: float
+
+    def __init__(self, start=None, end=None, seconds=None):
+        self.start = start
+        self.end = end
+        self.seconds = seconds
 
     def __enter__(self):
-        self.start = time.time()
+        self.start = time.perf_counter_ns()
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
-        self.end = time.time()
-        self.seconds = self.end - self.start
+        self.end = time.perf_counter_ns()
+        self.seconds = (self.end - self.start) / 1e9
 
     def format(self):
         return format_time(self.seconds)
 
 
+# Durations below a threshold use the formatter at the same index, longer ones use the last
+_THRESHOLDS = (1, 10, 100, 180, 6000)
+_FORMATTERS = (
+    lambda seconds: f"{seconds:.3f}s"[1:],  # e.g. .652s
+    lambda seconds: f"{seconds:.2f}s",  # e.g. 5.21s
+    lambda seconds: f"{seconds:.1f}s",  # e.g. 85.2s
+    lambda seconds: f"{seconds:4.0f}s",  # e.g.  152s
+    lambda seconds: f"{seconds // 60:2.0f}m{seconds % 60:02.0f}",  # e.g.  3m05
+    lambda seconds: f"{seconds // 60:4.0f}m",  # e.g.  120m
+)
+
+
 def format_time(seconds):
     """Returns a short string human readable duration (5 chars)
 
     Args:
         seconds (float)
     """
-
-    if seconds < 1:
-        return f"{seconds:.3f}s"[1:]  # e.g. .652s
-
-    if seconds < 10:
-        return f"{seconds:.2f}s"  # e.g. 5.21s
-
-    if seconds < 100:
-        return f"{seconds:.1f}s"  # e.g. 85.2s
-
-    if seconds < 180:
-        return f"{seconds:4.0f}s"  # e.g.  152s
-
-    minutes = seconds // 60
-    seconds = seconds % 60
-
-    if minutes < 100:
-        return f"{minutes:2.0f}m{seconds:02.0f}"
-
-    return f"{minutes:4.0f}m"
+    return _FORMATTERS[bisect.bisect_right(_THRESHOLDS, seconds)](seconds)
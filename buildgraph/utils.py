@@ -1,28 +1,67 @@
 import asyncio
+import contextvars
 import sys
 
 
+async def _write_queued(queue, writer):
+    """Pass chunks from `queue` to `writer` on a worker thread until a None is queued.
+    Chunks that queue up while a write is in progress are joined into a single write.
+    """
+    loop = asyncio.get_running_loop()
+    # Write in this task's context so the output is tabulated like the step that started it
+    context = contextvars.copy_context()
+    while True:
+        chunks = [await queue.get()]
+        while chunks[-1] is not None and not queue.empty():
+            chunks.append(queue.get_nowait())
+
+        done = chunks[-1] is None
+        if done:
+            chunks.pop()
+        if chunks:
+            await loop.run_in_executor(None, context.run, writer, b"".join(chunks))
+        if done:
+            return
+
+
 async def handle_async_reader(reader, writer):
     """Read from the asynchronous reader until EOF,
         simultaneously logging read bytes to `buffer`
         and accumulating read bytes.
 
+    Reading is decoupled from writing by a bounded queue, so a slow writer (e.g. a terminal
+    or a pipe to a log aggregator) doesn't stop the reader draining the process's output.
+
     Args:
         reader: A byte reader with an async read method
-        writer: A byte writer to log read bytes to
+        writer: A byte writer to log read bytes to, or None to only accumulate them
 
     Returns:
         bytes: All accumulated bytes read from the reader
     """
-    storage = b""
-    while True:
-        latest = await reader.read(1024)
-        if not latest:
-            break
-        storage += latest
-        writer(latest)
+    storage = bytearray()
+    queue = asyncio.Queue(maxsize=256)
+    write_task = (
+        None if writer is None else asyncio.ensure_future(_write_queued(queue, writer))
+    )
+    try:
+        while True:
+            # Match the default StreamReader buffer size so each read drains as much as is available
+            latest = await reader.read(65536)
+            if not latest:
+                break
+            storage.extend(latest)
+            if write_task is not None and not write_task.done():
+                await queue.put(latest)
+
+        if write_task is not None:
+            await queue.put(None)
+            await write_task  # Raises if the writer failed
+    finally:
+        if write_task is not None:
+            write_task.cancel()
 
-    return storage
+    return bytes(storage)
 
 
 async def execute_process_and_print(command, *args, suppress_log=False, **kwargs):
@@ -45,10 +84,10 @@ async def execute_process_and_print(command, *args, suppress_log=False, **kwargs
     )
 
     stdout = handle_async_reader(
-        process.stdout, sys.stdout.buffer.write if not suppress_log else lambda x: None
+        process.stdout, sys.stdout.buffer.write if not suppress_log else None
     )
     stderr = handle_async_reader(
-        process.stderr, sys.stderr.buffer.write if not suppress_log else lambda x: None
+        process.stderr, sys.stderr.buffer.write if not suppress_log else None
     )
     results = await asyncio.gather(process.wait(), stdout, stderr)
 
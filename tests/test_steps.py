@@ -1,3 +1,9 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
 from dataclasses import dataclass
 
 import pytest
@@ -5,13 +11,21 @@ import pytest
 from buildgraph import (
     BaseStep,
     CircularDependencyException,
+    GraphConstructionError,
     ParameterLengthException,
     TypeMismatchException,
     buildgraph,
+    cache,
+    setColour,
 )
+from buildgraph import graph as graph_module
 from buildgraph.base_step import StepFailedException
+from buildgraph.colours import colGetter
 from buildgraph.graph import EmptyGraphException
 from buildgraph.steps import CommandStep
+from buildgraph.tabulated_writer import TabulatedWriter, _tabulate
+from buildgraph.timer import format_time
+from buildgraph.utils import handle_async_reader
 
 
 class ReturnStep(BaseStep):
@@ -47,6 +61,19 @@ class ReturnsStringStep(BaseStep):
         return "no"
 
 
+class BarrierStep(BaseStep):
+    def execute(self, barrier, v):
+        barrier.wait()
+        return v
+
+
+class ImpureStep(BaseStep):
+    # Returns a new result each time it's run
+    def execute(self, counter):
+        counter()
+        return counter.i
+
+
 class Counter:
     def __init__(self) -> None:
         self.i = 0
@@ -55,6 +82,20 @@ class Counter:
         self.i += 1
 
 
+class Sink:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache.CACHE, "directory", str(tmp_path))
+    return tmp_path
+
+
 def test_returns_input():
     step = ReturnStep(5)
     assert step.run() == 5
@@ -96,6 +137,62 @@ def test_circular_dependency():
         a.run()
 
 
+def test_circular_dependency_names_loop():
+    a = ReturnStep(0).alias("a")
+    b = ReturnStep(a).alias("b")
+    a.after(b)
+    c = ReturnStep(b).alias("c")
+
+    with pytest.raises(CircularDependencyException) as error:
+        c.run()
+    assert "(c)" not in str(error.value)
+    assert "(a)" in str(error.value) or "(b)" in str(error.value)
+
+
+def test_deep_execution_order():
+    a = ReturnStep(0)
+    for _ in range(5000):
+        a = ReturnStep(a)
+
+    order = a.getExecutionOrder()
+    assert len(order) == 5001
+    assert order[-1] is a
+    assert len(a.getFullExecution()) == 5001
+
+
+def test_full_execution_tracks_after():
+    a = ReturnStep(0)
+    b = ReturnStep(a)
+    c = ReturnStep(1)
+    assert b.getFullExecution() == {a, b}
+
+    a.after(c)
+    assert b.getFullExecution() == {a, b, c}
+
+
+def test_diamond_dependency():
+    a = ReturnStep(1)
+    b = ReturnStep(a)
+    c = ReturnStep(a)
+    d = AddStep(b, c)
+
+    assert d.getExecutionOrder() == [a, b, c, d]
+    assert d.run() == 2
+
+
+def test_execution_order_tracks_after():
+    a = ReturnStep(0)
+    b = ReturnStep(1)
+    assert b.getExecutionOrder() == [b]
+
+    b.getExecutionOrder().clear()
+    assert b.getExecutionOrder() == [b]
+
+    b.after(a)
+    assert b.getExecutionOrder() == [a, b]
+    assert b.getExecutionSet() == {a, b}
+
+
 def test_two_dependencies():
     assert AddStep(1, 2).run() == 3
 
@@ -179,6 +276,45 @@ def test_returned_type_mismatch():
         NeedsIntStep(a)
 
 
+def test_subclass_signature():
+    class ParentStep(BaseStep):
+        def execute(self, a: int) -> int:
+            return a
+
+    class ChildStep(ParentStep):
+        def execute(self, a: str) -> str:
+            return a
+
+    ParentStep(1)
+    assert ChildStep("a").getResultType() is str
+    with pytest.raises(TypeMismatchException):
+        ChildStep(1)
+
+
+def test_static_and_class_execute():
+    class StaticStep(BaseStep):
+        @staticmethod
+        def execute(v):
+            return v
+
+    class ClassStep(BaseStep):
+        @classmethod
+        def execute(cls, v):
+            return v
+
+    assert StaticStep(3).run() == 3
+    assert ClassStep(4).run() == 4
+
+
+def test_varargs_only_execute():
+    class VarargsStep(BaseStep):
+        def execute(*args):
+            return len(args)
+
+    # `self` is collected into args along with the bound arguments
+    assert VarargsStep(1, 2).run() == 3
+
+
 def test_type_length_mismatch_long():
     with pytest.raises(ParameterLengthException):
         NeedsIntStep(1, 2)
@@ -204,6 +340,24 @@ def test_param_graph():
     assert loopmany.run() == 5
 
 
+def test_memoized_graph():
+    built = Counter()
+
+    @buildgraph(memoize=True)
+    def graph(n):
+        built.i += 1
+        return AddStep(n, 1)
+
+    assert graph(1) is graph(1)
+    assert graph(2) is not graph(1)
+    assert graph([1]) is not graph([1])  # Unhashable arguments are rebuilt
+    assert built.i == 4
+
+    config = {"name": "bob"}
+    assert graph(1, config=config) is graph(1, config=config)
+    assert graph(1, config=config) is not graph(1, config={"name": "bob"})
+
+
 def test_config_graph():
     @buildgraph()
     def getConfiggraph():
@@ -336,6 +490,44 @@ def test_command_step():
     assert result.stdout == b"Hi\n"
 
 
+def test_async_step():
+    class AsyncStep(BaseStep):
+        async def execute(self, v):
+            await asyncio.sleep(0)
+            return v
+
+    assert AddStep(AsyncStep(1), AsyncStep(2)).run() == 3
+    assert AddStep(AsyncStep(1), AsyncStep(2)).run(parallel=True) == 3
+
+
+def test_command_step_in_running_loop():
+    async def main():
+        return CommandStep("echo", "Hi").run()
+
+    assert asyncio.run(main()).stdout == b"Hi\n"
+
+
+def test_parallel_run_in_running_loop():
+    async def main():
+        return CommandStep("echo", "Hi").run(parallel=True)
+
+    assert asyncio.run(main()).stdout == b"Hi\n"
+
+
+def test_handle_async_reader():
+    written = []
+
+    async def main():
+        reader = asyncio.StreamReader()
+        for chunk in (b"a\n", b"b", b"c\n"):
+            reader.feed_data(chunk)
+        reader.feed_eof()
+        return await handle_async_reader(reader, written.append)
+
+    assert asyncio.run(main()) == b"a\nbc\n"
+    assert b"".join(written) == b"a\nbc\n"
+
+
 def test_command_step_with_kwarg():
     result = CommandStep("ls", cwd="tests").run()
 
@@ -383,6 +575,49 @@ def test_indent(capsys):
     assert "  HELLO" not in capsys.readouterr().out
 
 
+def test_tabulated_writer():
+    sink = Sink()
+    with TabulatedWriter(sink, "write"):
+        sink.write(b"a\nb\n")
+        sink.write(b"c\n")
+        sink.write(b"d")
+        sink.write(b"e\n")
+        sink.write(b"f")
+
+    assert sink.writes == [b"  a\n  b\n", b"  c\n", b"  d", b"e\n", b"  f", b"\n"]
+
+
+def test_tabulate_per_thread():
+    sink = Sink()
+    # All three threads must be writing at the same time to get past the barrier
+    barrier = threading.Barrier(3, timeout=5)
+
+    def tabulated(name):
+        with _tabulate(sink):
+            barrier.wait()
+            sink.write(name)
+            barrier.wait()
+
+    def plain():
+        barrier.wait()
+        sink.write(b"plain\n")
+        barrier.wait()
+
+    threads = [
+        threading.Thread(target=tabulated, args=(b"a\n",)),
+        threading.Thread(target=tabulated, args=(b"b\n",)),
+        threading.Thread(target=plain),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(sink.writes) == [b"  a\n", b"  b\n", b"plain\n"]
+    sink.write(b"after\n")
+    assert sink.writes[-1] == b"after\n"
+
+
 def test_ordering():
     @buildgraph()
     def graph():
@@ -397,6 +632,95 @@ def test_ordering():
     assert "-C-" in str(order[2])
 
 
+def test_after_front_deprecated():
+    a = ReturnStep(1)
+    b = ReturnStep(2).after(a)
+
+    with pytest.warns(DeprecationWarning):
+        b.after(ReturnStep(3), front=True)
+    assert b.after_deps[1] is a
+
+
+def test_graph_steps_not_chained():
+    @buildgraph()
+    def graph():
+        a = ReturnStep(1).alias("a")
+        b = ReturnStep(2).alias("b")
+        ReturnStep(3).alias("c")
+        return AddStep(a, b)
+
+    order = graph().getExecutionOrder()
+
+    assert [step._alias for step in order[:3]] == ["a", "b", "c"]
+    # Siblings don't depend on each other so they can run in parallel
+    assert order[1].getExecutionOrder() == [order[1]]
+    assert order[2].getExecutionOrder() == [order[2]]
+    assert set(order[-1].getExecutionOrder()) == set(order)
+
+
+def test_graph_forwards_to_root():
+    @buildgraph()
+    def graph():
+        return ReturnStep(1)
+
+    c = Counter()
+    before = RunStep(c)
+    g = graph()
+
+    assert g.after(before) is g
+    assert not g.wasrun
+    assert g.getExecutionOrder() == [before, g.root]
+    assert g.run() == 1
+    assert g.wasrun
+    assert c.i == 1
+
+
+@pytest.mark.skipif(not __debug__, reason="Graphs aren't validated under python -O")
+def test_graph_returns_outside_step(monkeypatch):
+    monkeypatch.setattr(graph_module, "VALIDATE_GRAPH", True)
+    outside = ReturnStep(1)
+
+    @buildgraph()
+    def graph():
+        ReturnStep(2)
+        return outside
+
+    @buildgraph()
+    def tupleGraph():
+        return ReturnStep(2), outside
+
+    with pytest.raises(GraphConstructionError):
+        graph()
+    with pytest.raises(GraphConstructionError):
+        tupleGraph()
+
+
+def test_graph_validation_disabled():
+    # VALIDATE_GRAPH is read when buildgraph is imported, so check it in a fresh interpreter
+    code = """
+from buildgraph import BaseStep, buildgraph
+
+class ReturnStep(BaseStep):
+    def execute(self, v):
+        return v
+
+outside = ReturnStep(1)
+
+@buildgraph()
+def graph():
+    ReturnStep(2)
+    return outside
+
+graph()
+"""
+    env = dict(os.environ, BUILDGRAPH_VALIDATE="0")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-c", code], env=env, cwd=root, capture_output=True
+    )
+    assert result.returncode == 0, result.stderr.decode()
+
+
 def test_graph_tuple():
     @buildgraph()
     def subgraph():
@@ -425,6 +749,262 @@ def test_graph_dict():
     assert subgraph.run() == {"a": 1, "b": 2}
 
 
+def test_format_time():
+    assert format_time(0.652) == ".652s"
+    assert format_time(5.214) == "5.21s"
+    assert format_time(85.24) == "85.2s"
+    assert format_time(152) == " 152s"
+    assert format_time(185) == " 3m05"
+    assert format_time(7200) == " 120m"
+
+
+def test_cached_result(cache_dir):
+    calls = []
+
+    class CachedStep(BaseStep):
+        cacheable = True
+
+        def execute(self, v):
+            calls.append(v)
+            return v * 2
+
+    assert CachedStep(2).run() == 4
+    assert CachedStep(2).run() == 4
+    assert calls == [2]
+
+    assert CachedStep(3).run() == 6
+    assert CachedStep(2).run(use_cache=False) == 4
+    assert calls == [2, 3, 2]
+
+
+def test_cached_result_upstream_change(cache_dir):
+    calls = []
+
+    class CachedStep(BaseStep):
+        cacheable = True
+
+        def execute(self, v):
+            calls.append(v)
+            return v
+
+    assert CachedStep(ReturnStep(1)).run() == 1
+    assert CachedStep(ReturnStep(1)).run() == 1
+    assert CachedStep(ReturnStep(2)).run() == 2
+    assert calls == [1, 2]
+
+
+def test_cached_result_deep_chain(cache_dir):
+
+    class CachedStep(BaseStep):
+        cacheable = True
+
+        def execute(self, v):
+            return v
+
+    a = ReturnStep(0)
+    for _ in range(5000):
+        a = ReturnStep(a)
+
+    assert CachedStep(a).run() == 0
+
+
+def test_cached_result_impure_upstream(cache_dir):
+    counter = Counter()
+
+    class CachedStep(BaseStep):
+        cacheable = True
+
+        def execute(self, v):
+            return v + 3
+
+    assert CachedStep(ImpureStep(counter)).run() == 4
+    assert CachedStep(ImpureStep(counter)).run() == 5
+
+
+def test_cache_store_concurrent(tmp_path):
+    store = cache.GraphCache(str(tmp_path))
+    barrier = threading.Barrier(8, timeout=5)
+    errors = []
+
+    def storeResult():
+        barrier.wait()
+        try:
+            store.store("same", "result")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=storeResult) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert store.load("same") == (True, "result")
+    assert os.listdir(tmp_path) == ["same.pkl"]
+
+
+def test_cache_store_unwritable(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    store = cache.GraphCache(str(blocker / "cache"))
+
+    store.store("key", "result")
+    assert store.load("key") == (False, None)
+
+
+def test_cache_load_stale_entry(tmp_path):
+    store = cache.GraphCache(str(tmp_path))
+    # A pickled reference to a class that no longer exists
+    (tmp_path / "stale.pkl").write_bytes(b"cbuildgraph.steps\nRemovedResult\n.")
+
+    assert store.load("stale") == (False, None)
+
+
+def test_fingerprint_ignores_after():
+    assert (
+        ReturnStep(1).after(ReturnStep(2)).fingerprint() == ReturnStep(1).fingerprint()
+    )
+
+
+def test_fingerprint_file_contents(tmp_path):
+    path = tmp_path / "input.txt"
+    path.write_text("a")
+    first = ReturnStep(path).fingerprint()
+    assert ReturnStep(path).fingerprint() == first
+
+    path.write_text("b")
+    assert ReturnStep(path).fingerprint() != first
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_pure_step_deduplicated(parallel):
+    calls = []
+
+    class PureStep(BaseStep):
+        pure = True
+
+        def execute(self, v):
+            calls.append(v)
+            return v
+
+    a = PureStep(1)
+    b = PureStep(1)
+    c = PureStep(2)
+
+    assert AddStep(AddStep(a, b), c).run(parallel=parallel) == 4
+    assert sorted(calls) == [1, 2]
+    assert b.result == 1
+
+
+def test_pure_step_deduplicated_in_graph():
+    calls = []
+
+    class RunTest(BaseStep):
+        pure = True
+
+        def execute(self, name):
+            calls.append(name)
+
+    @buildgraph()
+    def graph():
+        RunTest("api")
+        RunTest("api")
+
+    graph().run()
+    assert calls == ["api"]
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_pure_step_impure_upstream(parallel):
+    counter = Counter()
+
+    class PureStep(BaseStep):
+        pure = True
+
+        def execute(self, v):
+            return v
+
+    shared = ImpureStep(counter)
+    a = PureStep(ImpureStep(counter))
+    b = PureStep(ImpureStep(counter))
+    c = PureStep(shared)
+    d = PureStep(shared)
+
+    # Each impure step runs separately so the pure steps downstream can't share a result
+    assert AddStep(a, b).run(parallel=parallel) == 3
+    assert {a.result, b.result} == {1, 2}
+
+    # Pure steps fed by the same impure step can
+    assert AddStep(c, d).run(parallel=parallel) == 6
+    assert counter.i == 3
+
+
+def test_set_colour():
+    setColour(False)
+    assert colGetter.green == ""
+
+    setColour(True)
+    assert colGetter.green == "\033[0;32m"
+
+
+def test_parallel_run():
+    # Both steps must be running at the same time to get past the barrier
+    barrier = threading.Barrier(2, timeout=5)
+    a = BarrierStep(barrier, 1)
+    b = BarrierStep(barrier, 2)
+
+    assert AddStep(a, b).run(parallel=True) == 3
+
+
+def test_parallel_max_workers():
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    class TrackStep(BaseStep):
+        def execute(self):
+            with lock:
+                running.append(self)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(self)
+
+    steps = [TrackStep() for _ in range(6)]
+    RunStep(lambda: None).after(*steps).run(parallel=True, max_workers=2)
+
+    assert len(peak) == 6
+    assert max(peak) <= 2
+
+
+def test_parallel_failure():
+    c = Counter()
+
+    class FailStep(BaseStep):
+        def execute(self):
+            raise ValueError()
+
+    a = FailStep()
+    b = RunStep(c).after(a)
+
+    with pytest.raises(StepFailedException):
+        b.run(parallel=True)
+    assert c.i == 0
+
+
+def test_parallel_graph():
+    @buildgraph()
+    def graph():
+        a = CommandStep("echo", "a", suppress_log=True)
+        b = CommandStep("echo", "b", suppress_log=True)
+        return a, b
+
+    a, b = graph().run(parallel=True, max_workers=2)
+    assert a.stdout == b"a\n"
+    assert b.stdout == b"b\n"
+
+
 def test_implicit_decorator():
     @buildgraph
     def graph():